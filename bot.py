@@ -4,9 +4,13 @@
 import os
 import json
 import time
-import requests
-from datetime import datetime, timedelta
-from typing import List, Dict, Set
+import asyncio
+import heapq
+import httpx
+import orjson
+import sqlite3
+from aiolimiter import AsyncLimiter
+from typing import List, Dict, Set, Optional, Tuple
 import logging
 from dataclasses import dataclass
 
@@ -17,7 +21,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+# HTTP statuses worth retrying (rate limits and transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def to_address(wallet: int) -> str:
+    """Format an integer wallet key as a lowercase 0x-prefixed address"""
+    return f"0x{wallet:040x}"
+
+@dataclass(slots=True, frozen=True)
 class WalletInfo:
     address: str
     first_trade_time: int
@@ -26,20 +37,117 @@ class WalletInfo:
     markets_traded: int
 
 class PolymarketNewWalletScanner:
+    # Log record for a discovered wallet, compiled once for the class
+    _NEW_WALLET_FMT = (
+        "🆕 NEW WALLET | %s | first trade %s (%.1fh ago) | "
+        "%d trades | $%.2f volume | %d markets"
+    )
+    
     def __init__(self):
         # Polymarket API endpoints
         self.data_api = "https://data-api.polymarket.com"
         self.gamma_api = "https://gamma-api.polymarket.com"
         
+        # Shared HTTP/2 client, created once the event loop is running
+        self.client: Optional[httpx.AsyncClient] = None
+        self._etag_cache: Dict[str, Tuple[str, object]] = {}  # Request key -> (ETag, body)
+        self._etag_requested: Set[str] = set()  # Conditional request keys used this scan
+        self._inflight: Dict[str, asyncio.Task] = {}  # Request key -> pending fetch
+        self._holders_cache: Dict[str, Set[int]] = {}  # Condition ID -> holders, per scan
+        self._cutoff_time = 0  # New-wallet cutoff, set at the start of each scan
+        
         # State tracking
-        self.checked_wallets: Set[str] = set()
-        self.new_wallets: Dict[str, WalletInfo] = {}
+        self.checked_wallets: Set[int] = set()  # Wallets keyed by int(address, 16)
+        self.new_wallets: Dict[int, WalletInfo] = {}
+        self._by_time: List[Tuple[int, int]] = []  # Heap of (-first_trade_time, wallet), newest first
         
         # Configuration
         self.lookback_hours = 24
         self.markets_to_scan = 100  # Scan top 100 markets
+        self.max_concurrency = 20  # Concurrent API requests
+        self.max_requests_per_second = 50  # Token-bucket rate limit
+        self.queue_size = 1000  # Wallets buffered between holder fetches and analysis
+        self.max_retries = 3
+        self.retry_backoff = 0.3  # Seconds, doubled on each retry
+        self.cache_path = "wallet_cache.db"
+        
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._limiter = AsyncLimiter(self.max_requests_per_second, 1)
+        
+        # Persist analyzed wallets so restarts do not re-fetch them
+        self.db = sqlite3.connect(self.cache_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checked ("
+            "address TEXT PRIMARY KEY, first_trade_time INTEGER, total_trades INTEGER, "
+            "total_volume REAL, markets_traded INTEGER, checked_at INTEGER)"
+        )
+        self.checked_wallets.update(
+            int(address, 16) for (address,) in self.db.execute("SELECT address FROM checked")
+        )
+    
+    def create_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP/2 client shared by all API calls"""
+        return httpx.AsyncClient(
+            http2=True,  # Multiplex concurrent requests over one connection per host
+            follow_redirects=True,  # Match requests/aiohttp; httpx defaults to off
+            timeout=10,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60
+            )
+        )
+    
+    async def _get_json(self, url: str, params: Dict, conditional: bool = False):
+        """GET a JSON resource, sharing one request among identical concurrent calls"""
+        key = f"{url}?{sorted(params.items())}"
+        task = self._inflight.get(key)
+        
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_json(key, url, params, conditional))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        
+        # Shield so one cancelled caller does not cancel the shared fetch
+        return await asyncio.shield(task)
+    
+    async def _fetch_json(self, key: str, url: str, params: Dict, conditional: bool):
+        """GET a JSON resource, retrying rate limits and transient errors (None on HTTP error)"""
+        if conditional:
+            self._etag_requested.add(key)
         
-    def get_active_markets(self) -> List[Dict]:
+        # Conditional GET: send the last ETag, reuse the cached body on 304
+        cached = self._etag_cache.get(key) if conditional else None
+        headers = {"If-None-Match": cached[0]} if cached else None
+        
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._limiter:
+                        response = await self.client.get(url, params=params, headers=headers)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if cached and response.status_code == 304:
+                        return cached[1]
+                    
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        if not response.is_success:
+                            logger.debug("HTTP %d from %s", response.status_code, url)
+                            return None
+                        
+                        data = orjson.loads(response.content)
+                        
+                        etag = response.headers.get("ETag")
+                        if conditional and etag:
+                            self._etag_cache[key] = (etag, data)
+                        
+                        return data
+                
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+    
+    async def get_active_markets(self) -> List[Dict]:
         """Get list of active markets"""
         try:
             url = f"{self.gamma_api}/events"
@@ -49,17 +157,23 @@ class PolymarketNewWalletScanner:
                 "order": "volume24hr"  # Sort by 24h volume
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            events = await self._get_json(url, params, conditional=True)
+            
+            if events is None:
+                logger.error("Error fetching markets: HTTP error from %s", url)
+                return []
             
-            return response.json()
+            return events
             
         except Exception as e:
-            logger.error(f"Error fetching markets: {e}")
+            logger.error("Error fetching markets: %s", e)
             return []
     
-    def get_market_holders(self, condition_id: str) -> List[str]:
+    async def get_market_holders(self, condition_id: str) -> Set[int]:
         """Get top holders/traders in a market"""
+        if condition_id in self._holders_cache:
+            return self._holders_cache[condition_id]
+        
         try:
             url = f"{self.data_api}/holders"
             params = {
@@ -67,27 +181,28 @@ class PolymarketNewWalletScanner:
                 "limit": 100  # Get top 100 holders per market
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            holders_data = await self._get_json(url, params, conditional=True)
             
-            holders_data = response.json()
-            wallets = []
+            if holders_data is None:
+                return set()
             
             # Extract wallet addresses from holders
-            for token_data in holders_data:
-                holders = token_data.get("holders", [])
-                for holder in holders:
-                    wallet = holder.get("proxyWallet", "").lower()
-                    if wallet:
-                        wallets.append(wallet)
+            # (hex parsing is case-insensitive, no need to lower())
+            wallets = {
+                int(holder.get("proxyWallet") or "0", 16)
+                for token_data in holders_data
+                for holder in token_data.get("holders", [])
+            }
+            wallets.discard(0)
             
+            self._holders_cache[condition_id] = wallets
             return wallets
             
         except Exception as e:
-            logger.debug(f"Could not fetch holders for {condition_id}: {e}")
-            return []
+            logger.debug("Could not fetch holders for %s: %s", condition_id, e)
+            return set()
     
-    def get_wallet_trades(self, wallet: str) -> List[Dict]:
+    async def get_wallet_trades(self, wallet: str) -> List[Dict]:
         """Get all trades for a wallet"""
         try:
             url = f"{self.data_api}/trades"
@@ -96,83 +211,118 @@ class PolymarketNewWalletScanner:
                 "limit": 500  # Get up to 500 trades
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            return response.json()
+            return await self._get_json(url, params) or []
             
         except Exception as e:
-            logger.debug(f"Could not fetch trades for {wallet[:10]}...: {e}")
+            logger.debug("Could not fetch trades for %.10s...: %s", wallet, e)
             return []
     
-    def analyze_wallet(self, wallet: str, current_time: int) -> WalletInfo:
+    async def get_wallet_first_trade_time(self, wallet: str) -> Optional[int]:
+        """Get the timestamp of a wallet's earliest trade (single record)"""
+        try:
+            url = f"{self.data_api}/activity"
+            params = {
+                "user": wallet,
+                "type": "TRADE",
+                "limit": 1,
+                "sortBy": "TIMESTAMP",
+                "sortDirection": "ASC"  # Oldest first
+            }
+            
+            activity = await self._get_json(url, params)
+            
+            if not activity:
+                return None
+            
+            return activity[0].get("timestamp")
+            
+        except Exception as e:
+            logger.debug("Could not fetch first trade for %.10s...: %s", wallet, e)
+            return None
+    
+    def save_wallet(self, address: str, first_trade: int, wallet_info: Optional[WalletInfo] = None):
+        """Record an analyzed wallet (with stats, if fetched) in the cache"""
+        if wallet_info:
+            stats = (wallet_info.total_trades, wallet_info.total_volume, wallet_info.markets_traded)
+        else:
+            stats = (None, None, None)
+        
+        self.db.execute(
+            "INSERT OR REPLACE INTO checked VALUES (?, ?, ?, ?, ?, ?)",
+            (address, first_trade, *stats, int(time.time()))
+        )
+    
+    async def analyze_wallet(self, wallet: int) -> WalletInfo:
         """Analyze if wallet is new and get stats"""
-        trades = self.get_wallet_trades(wallet)
+        address = to_address(wallet)
         
-        if not trades:
-            return None
+        # Cheap gate: skip the full history unless the first trade is recent
+        first_trade = await self.get_wallet_first_trade_time(address)
         
-        # Get timestamps
-        timestamps = [trade.get("timestamp", 0) for trade in trades]
+        if first_trade is None:
+            return None
         
-        if not timestamps:
+        if first_trade < self._cutoff_time:
+            self.save_wallet(address, first_trade)
             return None
         
-        first_trade = min(timestamps)
+        trades = await self.get_wallet_trades(address)
         
-        # Calculate stats
-        total_volume = sum(
-            float(trade.get("price", 0)) * float(trade.get("size", 0))
-            for trade in trades
-        )
+        if not trades:
+            return None
+        
+        # Calculate stats in a single pass; /trades returns the most recent
+        # page only, so the first trade time comes from the probe above
+        total_volume = 0.0
+        markets = set()
         
-        unique_markets = len(set(trade.get("conditionId") for trade in trades))
+        for trade in trades:
+            total_volume += float(trade.get("price", 0)) * float(trade.get("size", 0))
+            markets.add(trade.get("conditionId"))
         
         wallet_info = WalletInfo(
-            address=wallet,
+            address=address,
             first_trade_time=first_trade,
             total_trades=len(trades),
             total_volume=total_volume,
-            markets_traded=unique_markets
+            markets_traded=len(markets)
         )
+        self.save_wallet(address, first_trade, wallet_info)
         
-        # Check if new wallet (first trade within lookback period)
-        cutoff_time = current_time - (self.lookback_hours * 3600)
-        
-        if first_trade >= cutoff_time:
-            return wallet_info
-        
-        return None
+        return wallet_info
     
     def log_new_wallet(self, wallet_info: WalletInfo):
         """Log discovered new wallet"""
-        first_trade_dt = datetime.fromtimestamp(wallet_info.first_trade_time)
+        # Skip the time formatting entirely when INFO is filtered out
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
         hours_ago = (time.time() - wallet_info.first_trade_time) / 3600
         
-        logger.info(f"""
-╔════════════════════════════════════════════════════════════════╗
-║ 🆕 NEW WALLET FOUND                                            ║
-╠════════════════════════════════════════════════════════════════╣
-║ Address: {wallet_info.address[:42]}...    ║
-║ First Trade: {first_trade_dt.strftime('%Y-%m-%d %H:%M:%S')} ({hours_ago:.1f}h ago)          ║
-║ Total Trades: {wallet_info.total_trades:<3}                                            ║
-║ Total Volume: ${wallet_info.total_volume:,.2f}                                  ║
-║ Markets Traded: {wallet_info.markets_traded:<3}                                          ║
-╚════════════════════════════════════════════════════════════════╝
-        """)
+        logger.info(
+            self._NEW_WALLET_FMT,
+            wallet_info.address,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(wallet_info.first_trade_time)),
+            hours_ago,
+            wallet_info.total_trades,
+            wallet_info.total_volume,
+            wallet_info.markets_traded
+        )
     
-    def scan_markets(self) -> int:
+    async def scan_markets(self) -> int:
         """Scan markets for new wallets"""
+        self._holders_cache.clear()
         logger.info("📊 Fetching active markets...")
         
-        markets = self.get_active_markets()
-        logger.info(f"Found {len(markets)} active markets to scan")
+        markets = await self.get_active_markets()
+        logger.info("Found %d active markets to scan", len(markets))
         
-        all_wallets = set()
-        current_time = int(time.time())
+        # Wallets whose first trade is before this are not new
+        self._cutoff_time = int(time.time()) - self.lookback_hours * 3600
         
-        # Get holders from each market
-        for i, event in enumerate(markets, 1):
+        # Collect (condition ID, question) pairs from each event
+        scan_targets = []
+        for event in markets:
             markets_list = event.get("markets", [])
             
             for market in markets_list:
@@ -180,85 +330,134 @@ class PolymarketNewWalletScanner:
                 if not condition_id:
                     continue
                 
-                logger.info(f"Scanning market {i}/{len(markets)}: {market.get('question', 'Unknown')[:50]}...")
-                
-                holders = self.get_market_holders(condition_id)
-                all_wallets.update(holders)
-                
-                time.sleep(0.1)  # Rate limiting
-        
-        logger.info(f"✅ Found {len(all_wallets)} unique wallets across all markets")
+                scan_targets.append((condition_id, market.get("question", "Unknown")))
         
-        # Check each wallet
+        # Pipeline: holder fetches feed unseen wallets straight into analysis
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        queued = 0
         new_count = 0
-        for wallet in all_wallets:
-            if wallet in self.checked_wallets:
-                continue
-            
-            self.checked_wallets.add(wallet)
-            
-            # Analyze wallet
-            wallet_info = self.analyze_wallet(wallet, current_time)
+        
+        async def produce(i: int, condition_id: str, question: str):
+            nonlocal queued
+            holders = await self.get_market_holders(condition_id)
+            logger.info("Scanned market %d/%d: %.50s... (%d holders)", i, len(scan_targets), question, len(holders))
             
-            if wallet_info:
-                self.new_wallets[wallet] = wallet_info
-                self.log_new_wallet(wallet_info)
-                new_count += 1
+            # Claim unseen wallets before awaiting so producers never overlap
+            todo = holders - self.checked_wallets
+            self.checked_wallets |= todo
+            queued += len(todo)
             
-            time.sleep(0.1)  # Rate limiting
+            for wallet in todo:
+                await queue.put(wallet)
+        
+        async def consume():
+            nonlocal new_count
+            while True:
+                wallet = await queue.get()
+                try:
+                    wallet_info = await self.analyze_wallet(wallet)
+                    
+                    if wallet_info:
+                        self.new_wallets[wallet] = wallet_info
+                        heapq.heappush(self._by_time, (-wallet_info.first_trade_time, wallet))
+                        self.log_new_wallet(wallet_info)
+                        new_count += 1
+                except Exception as e:
+                    logger.error("Error analyzing wallet %s: %s", to_address(wallet), e)
+                finally:
+                    queue.task_done()
+        
+        consumers = [asyncio.create_task(consume()) for _ in range(self.max_concurrency)]
+        try:
+            await asyncio.gather(
+                *[produce(i, cid, question) for i, (cid, question) in enumerate(scan_targets, 1)]
+            )
+            await queue.join()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+        
+        logger.info("✅ Analyzed %d unseen wallets across all markets", queued)
+        
+        # Drop cached bodies for requests not made this scan (markets rotate
+        # out of the top list), so the ETag cache stays bounded
+        for key in self._etag_cache.keys() - self._etag_requested:
+            del self._etag_cache[key]
+        self._etag_requested.clear()
+        
+        # One commit per scan instead of one per wallet
+        self.db.commit()
         
         return new_count
     
+    async def _run_async(self, interval: int):
+        """Scan loop, run inside the event loop"""
+        scan_count = 0
+        next_scan = time.monotonic()
+        
+        async with self.create_client() as self.client:
+            while True:
+                try:
+                    scan_count += 1
+                    logger.info("🔄 Scan #%d", scan_count)
+                    
+                    # Scan markets for new wallets
+                    new_found = await self.scan_markets()
+                    
+                    # Fixed-rate schedule: subtract scan time from the wait
+                    next_scan += interval
+                    delay = next_scan - time.monotonic()
+                    
+                    # Summary
+                    logger.info(
+                        "📊 Scan complete: %d new this scan | %d new total | %d wallets checked | next scan in %.0fs",
+                        new_found,
+                        len(self.new_wallets),
+                        len(self.checked_wallets),
+                        max(delay, 0)
+                    )
+                    
+                    # Wait before next iteration
+                    if delay > 0:
+                        logger.info("💤 Sleeping for %.0f seconds...", delay)
+                        await asyncio.sleep(delay)
+                    else:
+                        logger.warning("⚠️ Scan overran the %ds interval by %.1fs", interval, -delay)
+                        next_scan = time.monotonic()
+                    
+                except Exception as e:
+                    logger.error("❌ Error in main loop: %s", e)
+                    await asyncio.sleep(60)
+                    next_scan = time.monotonic()
+    
     def run(self, interval: int = 300):
         """Main bot loop"""
         logger.info("=" * 70)
         logger.info("🤖 Polymarket New Wallet Scanner")
         logger.info("=" * 70)
-        logger.info(f"⏰ Finding wallets with first trade in last {self.lookback_hours} hours")
-        logger.info(f"🔄 Scanning every {interval} seconds ({interval//60} minutes)")
-        logger.info(f"📈 Checking top {self.markets_to_scan} markets by volume")
+        logger.info("⏰ Finding wallets with first trade in last %d hours", self.lookback_hours)
+        logger.info("🔄 Scanning every %d seconds (%d minutes)", interval, interval // 60)
+        logger.info("📈 Checking top %d markets by volume", self.markets_to_scan)
         logger.info("=" * 70)
         
-        scan_count = 0
+        try:
+            asyncio.run(self._run_async(interval))
+            
+        except KeyboardInterrupt:
+            logger.info("🛑 Bot stopped by user")
+            logger.info("📊 Final Stats: Found %d new wallets", len(self.new_wallets))
+            
+            if self.new_wallets:
+                logger.info("📋 Summary of all new wallets found:")
+                while self._by_time:
+                    _, wallet = heapq.heappop(self._by_time)
+                    wallet_info = self.new_wallets[wallet]
+                    logger.info("   %s: $%.2f volume", wallet_info.address, wallet_info.total_volume)
         
-        while True:
-            try:
-                scan_count += 1
-                logger.info(f"\n🔄 Scan #{scan_count} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                logger.info("-" * 70)
-                
-                # Scan markets for new wallets
-                new_found = self.scan_markets()
-                
-                # Summary
-                logger.info(f"""
-📊 Scan Complete:
-   ├─ New wallets this scan: {new_found}
-   ├─ Total new wallets found: {len(self.new_wallets)}
-   ├─ Wallets checked: {len(self.checked_wallets)}
-   └─ Next scan in {interval} seconds ({interval//60} minutes)
-{"=" * 70}
-                """)
-                
-                # Wait before next iteration
-                logger.info(f"💤 Sleeping for {interval//60} minutes...")
-                time.sleep(interval)
-                
-            except KeyboardInterrupt:
-                logger.info("\n🛑 Bot stopped by user")
-                logger.info(f"📊 Final Stats: Found {len(self.new_wallets)} new wallets")
-                
-                if self.new_wallets:
-                    logger.info("\n📋 Summary of all new wallets found:")
-                    for wallet_info in sorted(self.new_wallets.values(), 
-                                            key=lambda x: x.first_trade_time, 
-                                            reverse=True):
-                        logger.info(f"   {wallet_info.address}: ${wallet_info.total_volume:,.2f} volume")
-                
-                break
-            except Exception as e:
-                logger.error(f"❌ Error in main loop: {e}")
-                time.sleep(60)
+        finally:
+            self.db.commit()
+            self.db.close()
 
 def main():
     """Entry point"""